@@ -1,86 +1,464 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, send_from_directory, stream_with_context, url_for
 from flask_cors import CORS
+from werkzeug.exceptions import NotFound
 import ollama
 from pymongo import MongoClient
+from bson import ObjectId
+from bson.errors import InvalidId
+import gridfs
+from pymongo.write_concern import WriteConcern
 from datetime import datetime
+import numpy as np
+import orjson
+import atexit
+import base64
+import concurrent.futures
+import hashlib
+import json
 import os
-import re
+import random
+import tempfile
+import time
 import logging
+import threading
 import requests
 
 app = Flask(__name__)
 CORS(app)
+# When deployed behind a proxy that honours X-Sendfile (Apache mod_xsendfile, lighttpd),
+# set JOURNAL_USE_X_SENDFILE=1 so file downloads are sent by the proxy straight from disk.
+# Otherwise send_from_directory hands the open file to the server's wsgi.file_wrapper
+# (sendfile(2) under gunicorn), so the bytes still never pass through Python.
+app.use_x_sendfile = os.environ.get('JOURNAL_USE_X_SENDFILE') == '1'
 
 # Configure logging for the Flask app
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# --- Helper function to retry startup checks ---
+STARTUP_ATTEMPTS = 5
+
+def retry_with_backoff(action, description):
+    """
+    Calls action() until it succeeds, waiting 1s, 2s, 4s, ... plus random jitter
+    between attempts so workers starting together don't retry in lockstep.
+    Re-raises the last error once STARTUP_ATTEMPTS attempts have failed.
+    """
+    for attempt in range(STARTUP_ATTEMPTS):
+        try:
+            return action()
+        except Exception as e:
+            if attempt == STARTUP_ATTEMPTS - 1:
+                raise
+            delay = 2 ** attempt + random.uniform(0, 1)
+            app.logger.warning(f"{description} failed (attempt {attempt + 1}/{STARTUP_ATTEMPTS}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
 # --- Ollama Model Configuration ---
 model_name = 'mistral' # Ensure this model is pulled: ollama pull mistral
+embed_model_name = 'nomic-embed-text' # Used for the /enhance semantic cache: ollama pull nomic-embed-text
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
+# One client for the whole app so its keep-alive connection to the Ollama daemon is reused
+ollama_client = ollama.Client(host=OLLAMA_HOST, timeout=120)
+# Concurrent Ollama calls allowed per worker process. Set OLLAMA_NUM_PARALLEL for 'ollama serve'
+# to this times the number of workers so the server can actually run them all at once.
+JOURNAL_OLLAMA_SLOTS = int(os.environ.get('JOURNAL_OLLAMA_SLOTS', 4))
+ollama_slots = threading.BoundedSemaphore(JOURNAL_OLLAMA_SLOTS)
+OLLAMA_KEEP_ALIVE = '30m' # Keep the model loaded between requests instead of the 5 minute default
+
+# Sent as an unchanging system message so Ollama can reuse its cached prompt prefix across requests
+ENHANCE_TEMPLATE = ('Enhance the journal entry provided by the user into a more lovable and readable form, '
+                    'incorporating relevant emojis where appropriate. Keep the original meaning and tone. '
+                    'Make it sound warm and reflective.')
+ENHANCE_OPTIONS = {
+    'temperature': 0.7, # Controls randomness
+    'num_predict': 500 # Max tokens to generate
+    # 'num_keep' is added by warm_enhance_prompt() once the template's token count is known
+}
 
 # --- MongoDB Configuration ---
 MONGO_URI = "mongodb://localhost:27017/" # Default MongoDB URI
 DB_NAME = "journal_app_db"
 COLLECTION_NAME = "journal_entries"
+ENTRIES_MAX_PAGE_SIZE = 200 # Upper bound for /get_entries?limit=
 
 try:
-    client = MongoClient(MONGO_URI)
+    client = MongoClient(
+        MONGO_URI,
+        maxPoolSize=200, # Room for every worker thread to hold a connection
+        minPoolSize=10, # Keep warm connections so bursts don't pay the handshake
+        maxIdleTimeMS=300_000,
+        waitQueueTimeoutMS=2_000, # Fail fast instead of queueing forever when the pool is exhausted
+        serverSelectionTimeoutMS=2_000, # Keeps each startup ping attempt short
+        compressors='zstd,snappy,zlib' # Shrinks base64 images on the wire; unavailable codecs are skipped
+    )
+    # MongoClient connects lazily, so ping to find out now whether the server is reachable
+    retry_with_backoff(lambda: client.admin.command('ping'), "MongoDB connection")
     db = client[DB_NAME]
     journal_collection = db[COLLECTION_NAME]
-    app.logger.info(f"Successfully connected to MongoDB: {DB_NAME}")
+    image_fs = gridfs.GridFS(db) # Image bytes live here; entries only hold a reference
+    # Lets get_entries walk the index in order instead of sorting in memory
+    journal_collection.create_index([("timestamp", -1)], name="ts_desc")
+    app.logger.info("Successfully connected to MongoDB: %s", DB_NAME)
 except Exception as e:
     app.logger.error(f"Error connecting to MongoDB: {e}")
-    # It's critical to have a DB connection, so exit if it fails
+    # It's critical to have a DB connection, so exit if it still fails after retrying
     exit(1)
 
 # --- Configuration for Local File Storage ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 JOURNAL_FILES_DIR = os.path.join(BASE_DIR, 'journal_files')
+JOURNAL_FILES_PREFIX = os.path.abspath(JOURNAL_FILES_DIR) + os.sep # Every servable file path starts with this
 os.makedirs(JOURNAL_FILES_DIR, exist_ok=True) # Ensure the directory exists
-app.logger.info(f"Journal text files will be saved in: {JOURNAL_FILES_DIR}")
+# Local file writes run here so requests don't wait on disk latency
+io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix='journal-io')
+atexit.register(io_pool.shutdown, wait=True)
+app.logger.info("Journal text files will be saved in: %s", JOURNAL_FILES_DIR)
+
+# --- Semantic Cache Configuration for /enhance ---
+ENHANCE_CACHE_PATH = os.path.join(BASE_DIR, 'enhance_cache.npz')
+ENHANCE_CACHE_THRESHOLD = 0.92 # Cosine similarity needed to reuse a previous enhancement
+ENHANCE_CACHE_MAX_ENTRIES = 10_000 # Least recently used entries are evicted beyond this
+# Saved caches built with a different model, embedding model or prompt are discarded on load
+ENHANCE_CACHE_KEY = f"{model_name}|{embed_model_name}|{hashlib.sha256(ENHANCE_TEMPLATE.encode('utf-8')).hexdigest()}"
+
+# --- Semantic cache of previous enhancements ---
+class SemanticCache:
+    """
+    Maps L2-normalized text embeddings to previously generated enhancements.
+    A lookup returns the cached text whose embedding has the highest cosine
+    similarity with the query, provided it clears the threshold. When full,
+    the least recently used entry is overwritten. The key identifies what
+    produced the cached texts; saved caches with a different key are ignored.
+    """
+
+    def __init__(self, threshold, max_entries, key):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.key = key
+        self._lock = threading.Lock()
+        self._vectors = None # (capacity, dim) float32 matrix, only the first _size rows are live
+        self._last_used = np.zeros(0, dtype=np.int64)
+        self._texts = []
+        self._clock = 0
+
+    def __len__(self):
+        return len(self._texts)
+
+    def lookup(self, vector):
+        """Return the cached enhancement most similar to vector, or None on a miss."""
+        with self._lock:
+            size = len(self._texts)
+            if size == 0 or self._vectors.shape[1] != vector.shape[0]:
+                return None
+            scores = self._vectors[:size] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            return self._texts[best]
+
+    def add(self, vector, text):
+        """Store text under vector, evicting the least recently used entry if full."""
+        with self._lock:
+            self._clock += 1
+            size = len(self._texts)
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                # First entry, or the embedding model changed: start over
+                self._vectors = np.empty((min(64, self.max_entries), vector.shape[0]), dtype=np.float32)
+                self._last_used = np.zeros(self._vectors.shape[0], dtype=np.int64)
+                self._texts = []
+                size = 0
+            if size >= self.max_entries:
+                slot = int(np.argmin(self._last_used[:size]))
+                self._texts[slot] = text
+            else:
+                if size == self._vectors.shape[0]:
+                    # Grow geometrically so inserts stay amortized O(dim)
+                    capacity = min(size * 2, self.max_entries)
+                    self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+                    self._last_used = np.resize(self._last_used, capacity)
+                slot = size
+                self._texts.append(text)
+            self._vectors[slot] = vector
+            self._last_used[slot] = self._clock
+
+    def save(self, path):
+        """Write the cache to path (an .npz file), replacing any previous copy atomically."""
+        with self._lock:
+            size = len(self._texts)
+            if size == 0:
+                return
+            # A private temp file per save, so workers saving at the same time can't mix their writes
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.savez(f, vectors=self._vectors[:size], last_used=self._last_used[:size],
+                             texts=np.array(json.dumps(self._texts)), key=np.array(self.key))
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+    def load(self, path):
+        """
+        Populate the cache from a file previously written by save().
+        Returns False, leaving the cache empty, if the file was saved under a different key.
+        """
+        with np.load(path) as data:
+            if 'key' not in data.files or str(data['key']) != self.key:
+                return False
+            vectors = data['vectors'].astype(np.float32)
+            last_used = data['last_used'].astype(np.int64)
+            texts = json.loads(str(data['texts']))
+        # Keep only the most recently used entries if the bound was lowered
+        keep = np.argsort(last_used)[-self.max_entries:]
+        with self._lock:
+            self._vectors = vectors[keep]
+            self._last_used = last_used[keep]
+            self._texts = [texts[i] for i in keep]
+            self._clock = int(self._last_used.max()) if len(self._texts) else 0
+        return True
+
+enhance_cache = SemanticCache(ENHANCE_CACHE_THRESHOLD, ENHANCE_CACHE_MAX_ENTRIES, ENHANCE_CACHE_KEY)
+enhance_cache_enabled = True # Turned off at startup if the embedding model isn't available
+if os.path.exists(ENHANCE_CACHE_PATH):
+    try:
+        if enhance_cache.load(ENHANCE_CACHE_PATH):
+            app.logger.info("Loaded %d cached enhancements from %s", len(enhance_cache), ENHANCE_CACHE_PATH)
+        else:
+            app.logger.info("Discarding enhancement cache at %s: built with a different model or prompt", ENHANCE_CACHE_PATH)
+    except Exception as e:
+        app.logger.warning(f"Could not load enhancement cache from {ENHANCE_CACHE_PATH}, starting empty: {e}")
+
+@atexit.register
+def save_enhance_cache():
+    try:
+        enhance_cache.save(ENHANCE_CACHE_PATH)
+    except Exception as e:
+        app.logger.error(f"Error saving enhancement cache to {ENHANCE_CACHE_PATH}: {e}")
+
+# --- Helper function to embed text for the semantic cache ---
+def embed_text(text):
+    """
+    Returns the L2-normalized embedding of text as a float32 vector,
+    or None if the embedding model is unavailable.
+    """
+    try:
+        embedding = ollama_client.embeddings(model=embed_model_name, prompt=text)['embedding']
+    except Exception as e:
+        app.logger.warning(f"Could not embed text with '{embed_model_name}', skipping enhancement cache: {e}")
+        return None
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return vector / norm
+
+# --- Helper functions for JSON responses ---
+def _json_default(obj):
+    """Serializes the types orjson doesn't handle natively."""
+    if isinstance(obj, ObjectId):
+        return str(obj) # MongoDB IDs are sent to the frontend as strings
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dump_json(obj):
+    """Serializes obj to JSON bytes with orjson."""
+    return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+def ojson(obj, status=200):
+    """Drop-in replacement for jsonify() backed by orjson."""
+    return app.response_class(dump_json(obj), status=status, mimetype='application/json')
 
 # --- Helper function to sanitize filename ---
+# Translation table that replaces spaces with underscores and removes
+# characters that are illegal in typical file systems, in a single pass
+_FILENAME_TRANSLATION = str.maketrans({' ': '_', **{c: None for c in '<>:"/\\|?*'}})
+
 def sanitize_filename(filename):
     """Remove illegal characters and replace spaces for a valid filename."""
     if not filename:
         return "untitled"
-    # Replace spaces with underscores
-    filename = filename.replace(" ", "_")
-    # Remove characters that are illegal in typical file systems
-    filename = re.sub(r'[<>:"/\\|?*]', '', filename)
     # Limit filename length to prevent issues on some OS
-    return filename[:100]
+    return filename.translate(_FILENAME_TRANSLATION)[:100]
+
+# Turns an ISO timestamp (2025-07-24T05:04:19.213569) into 20250724_050419_213569
+_TIMESTAMP_TRANSLATION = str.maketrans({'-': None, ':': None, 'T': '_', '.': '_'})
+
+# --- Helper function to write a file on the I/O pool ---
+def _write_file(file_path, data):
+    """Writes bytes to file_path, logging rather than raising on failure."""
+    try:
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        app.logger.info("Successfully saved entry to local file: %s", file_path)
+    except Exception as e:
+        app.logger.error(f"Error writing local file '{file_path}': {e}", exc_info=True)
 
 # --- Helper function to save content to a local file ---
 def save_entry_to_local_file(entry_data):
     """
     Saves the journal entry content (original and enhanced text, title, date)
-    to a local .txt file within the JOURNAL_FILES_DIR.
-    Returns the generated filename if successful, None otherwise.
+    to a local .txt file within the JOURNAL_FILES_DIR. The write itself runs
+    on io_pool, so this returns before the data reaches disk.
+    Returns the generated filename if the write was scheduled, None otherwise.
     """
     try:
         title = entry_data.get('title', 'untitled_entry')
         sanitized_title = sanitize_filename(title)
-        # Use a timestamp to ensure uniqueness and chronological order
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S_%f") # Added microseconds for more uniqueness
+        # Use a timestamp to ensure uniqueness and chronological order, reusing the
+        # entry's own ISO timestamp rather than reading the clock again
+        timestamp = entry_data.get('timestamp') or datetime.now().isoformat(timespec='microseconds')
+        timestamp_str = timestamp.translate(_TIMESTAMP_TRANSLATION) # YYYYMMDD_HHMMSS_ffffff, microseconds for more uniqueness
         filename = f"{sanitized_title}_{timestamp_str}.txt"
         file_path = os.path.join(JOURNAL_FILES_DIR, filename)
 
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(f"Title: {entry_data.get('title', 'No Title')}\n")
-            f.write(f"Date: {entry_data.get('date', 'N/A')} Time: {entry_data.get('time', 'N/A')}\n")
-            if entry_data.get('imageUrl'):
-                f.write(f"Image Attached: Yes (Base64 data not stored in text file for brevity)\n")
-            f.write("\n-- Original Entry --\n")
-            f.write(entry_data.get('originalText', 'No original text provided.'))
-            f.write("\n\n-- AI-Enhanced Version --\n")
-            f.write(entry_data.get('enhancedText', 'No AI enhancement provided.'))
-            f.write("\n")
-        app.logger.info(f"Successfully saved entry to local file: {file_path}")
+        # Assemble the whole file in memory so it is written with a single syscall
+        has_image = entry_data.get('imageRef') or entry_data.get('imageUrl')
+        image_line = "Image Attached: Yes (Base64 data not stored in text file for brevity)\n" if has_image else ""
+        body = (
+            f"Title: {entry_data.get('title', 'No Title')}\n"
+            f"Date: {entry_data.get('date', 'N/A')} Time: {entry_data.get('time', 'N/A')}\n"
+            f"{image_line}"
+            "\n-- Original Entry --\n"
+            f"{entry_data.get('originalText') or 'No original text provided.'}"
+            "\n\n-- AI-Enhanced Version --\n"
+            f"{entry_data.get('enhancedText') or 'No AI enhancement provided.'}"
+            "\n"
+        )
+        io_pool.submit(_write_file, file_path, body.encode('utf-8'))
         return filename
     except Exception as e:
         app.logger.error(f"Error saving entry to local file for title '{entry_data.get('title')}': {e}", exc_info=True)
         return None
 
+# --- Helper function to move an uploaded image into GridFS ---
+# Only raster formats are served from /get_image; anything else (e.g. SVG, which can
+# carry scripts) stays an inline data URL that the browser only renders inside <img>
+ALLOWED_IMAGE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+
+def store_image(image_url, title):
+    """
+    Saves a base64 data URL (data:image/...;base64,...) to GridFS.
+    Returns (file_id, mime_type), or None if image_url is not a base64 image
+    of an allowed type.
+    """
+    if not image_url or not image_url.startswith('data:image/'):
+        return None
+    header, _, encoded = image_url.partition(',')
+    if not header.endswith(';base64'):
+        return None
+    mime_type = header[len('data:'):-len(';base64')].lower()
+    if mime_type not in ALLOWED_IMAGE_TYPES:
+        return None
+    image_id = image_fs.put(base64.b64decode(encoded), filename=f"{sanitize_filename(title)}.img",
+                            metadata={"contentType": mime_type})
+    return image_id, mime_type
+
+# --- Helper function to build a journal entry document ---
+def build_entry(title, original_text, enhanced_text, image_url):
+    """
+    Returns the MongoDB document for a new journal entry, timestamped now.
+    Uploaded images are stored in GridFS and referenced by imageRef;
+    external image URLs are kept as-is in imageUrl.
+    """
+    # Format the time once; date and time are slices of the ISO string (YYYY-MM-DDTHH:MM:SS.ffffff)
+    timestamp = datetime.now().isoformat(timespec='microseconds')
+    entry = {
+        "title": title,
+        "originalText": original_text,
+        "enhancedText": enhanced_text,
+        "timestamp": timestamp, # ISO format for easy sorting and parsing
+        "date": timestamp[:10],
+        "time": timestamp[11:19]
+    }
+    stored_image = store_image(image_url, title)
+    if stored_image:
+        entry["imageRef"], entry["imageMime"] = stored_image
+    else:
+        entry["imageUrl"] = image_url
+    return entry
+
+# --- Helper function to point an entry's imageUrl at its GridFS image ---
+def add_image_url(entry):
+    """Sets imageUrl to the /get_image link for entries whose image is in GridFS."""
+    if entry.get("imageRef"):
+        entry["imageUrl"] = url_for('get_image', image_id=str(entry["imageRef"]), _external=True)
+    return entry
+
+# --- Helper function to preload the enhancement prompt into Ollama ---
+def warm_enhance_prompt():
+    """
+    Sends the enhancement template once with an empty entry so the model is
+    loaded and the template's KV cache is filled before the first request.
+    The reported prompt token count is used as num_keep, so the template
+    stays in the context window when long entries make Ollama shift it.
+    """
+    try:
+        response = ollama_client.chat(
+            model=model_name,
+            messages=[
+                {'role': 'system', 'content': ENHANCE_TEMPLATE},
+                {'role': 'user', 'content': ''}
+            ],
+            stream=False,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            options={'num_predict': 1}
+        )
+        prefix_tokens = response.get('prompt_eval_count')
+        if prefix_tokens:
+            ENHANCE_OPTIONS['num_keep'] = prefix_tokens
+        app.logger.info("Warmed enhancement prompt cache (%s prefix tokens).", prefix_tokens)
+    except Exception as e:
+        app.logger.warning(f"Could not warm the enhancement prompt cache: {e}")
+
+# --- Helper function to coalesce identical in-flight enhancements ---
+_inflight_lock = threading.Lock()
+_inflight_enhancements = {} # journal text -> Future for the Ollama response being generated
+
+def request_enhancement(journal_text):
+    """
+    Returns (response, shared) for an Ollama enhancement of journal_text.
+    If the same text is already being enhanced for another request, this waits
+    for that call instead of starting a new one and returns shared=True.
+    Errors from the shared call are raised in every waiting request.
+    """
+    with _inflight_lock:
+        future = _inflight_enhancements.get(journal_text)
+        if future is not None:
+            shared = True
+        else:
+            shared = False
+            future = concurrent.futures.Future()
+            _inflight_enhancements[journal_text] = future
+
+    if shared:
+        app.logger.info("Joining in-flight enhancement for identical journal text.")
+        return future.result(), True
+
+    try:
+        # Ollama chat completion call, capped so the backend is not oversubscribed
+        with ollama_slots:
+            response = ollama_client.chat(
+                model=model_name,
+                messages=[
+                    {'role': 'system', 'content': ENHANCE_TEMPLATE},
+                    {'role': 'user', 'content': journal_text}
+                ],
+                stream=False, # We want the full response at once
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                options=ENHANCE_OPTIONS
+            )
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(response)
+        return response, False
+    finally:
+        with _inflight_lock:
+            del _inflight_enhancements[journal_text]
+
 # --- API Route: Enhance Journal Entry with Ollama ---
 @app.route('/enhance', methods=['POST'])
 def enhance_journal():
@@ -89,41 +467,41 @@ def enhance_journal():
 
     if not journal_text:
         app.logger.warning("Enhance request received without journal text.")
-        return jsonify({"error": "No journal text provided"}), 400
+        return ojson({"error": "No journal text provided"}, 400)
+
+    app.logger.info("Received journal text for enhancement: %.50s...", journal_text)
 
-    app.logger.info(f"Received journal text for enhancement: {journal_text[:50]}...")
+    # Reuse a previous enhancement if a near-identical entry was already enhanced
+    query_vector = embed_text(journal_text) if enhance_cache_enabled else None
+    if query_vector is not None:
+        cached_text = enhance_cache.lookup(query_vector)
+        if cached_text is not None:
+            app.logger.info("Returning cached enhancement for similar journal text.")
+            return ojson({"enhancedText": cached_text})
 
     try:
-        # Ollama chat completion call
-        response = ollama.chat(
-            model=model_name,
-            messages=[
-                {'role': 'user', 'content': f'Enhance the following journal entry into a more lovable and readable form, incorporating relevant emojis where appropriate. Keep the original meaning and tone. Make it sound warm and reflective. Here is the entry: \n\n"{journal_text}"'}
-            ],
-            stream=False, # We want the full response at once
-            options={
-                'temperature': 0.7, # Controls randomness
-                'num_predict': 500 # Max tokens to generate
-            }
-        )
+        response, shared = request_enhancement(journal_text)
 
         # Extract the content from the response
         enhanced_text = response['message']['content']
-        app.logger.info(f"Successfully enhanced text (first 50 chars): {enhanced_text[:50]}...")
-        return jsonify({"enhancedText": enhanced_text})
+        app.logger.info("Successfully enhanced text (first 50 chars): %.50s...", enhanced_text)
+        # Only the request that actually called Ollama caches the result
+        if query_vector is not None and not shared:
+            enhance_cache.add(query_vector, enhanced_text)
+        return ojson({"enhancedText": enhanced_text})
 
     except ollama.ResponseError as e:
         app.logger.error(f"Ollama API error (Status: {e.status_code}, Message: {e.message})", exc_info=True)
-        return jsonify({"error": f"Ollama API error: {e.message}"}), e.status_code
+        return ojson({"error": f"Ollama API error: {e.message}"}, e.status_code)
     except requests.exceptions.ConnectionError as e:
         app.logger.error(f"Connection error to Ollama server: {e}", exc_info=True)
-        return jsonify({"error": "Could not connect to Ollama server. Please ensure Ollama is running."}), 500
+        return ojson({"error": "Could not connect to Ollama server. Please ensure Ollama is running."}, 500)
     except KeyError as e:
         app.logger.error(f"KeyError in Ollama response: Missing key {e}. Raw response: {response}", exc_info=True)
-        return jsonify({"error": "Unexpected response format from Ollama. Please check Ollama API response structure."}), 500
+        return ojson({"error": "Unexpected response format from Ollama. Please check Ollama API response structure."}, 500)
     except Exception as e:
         app.logger.error(f"An unexpected error occurred during Ollama interaction: {e}", exc_info=True)
-        return jsonify({"error": f"Failed to enhance text due to an unexpected error: {str(e)}"}), 500
+        return ojson({"error": f"Failed to enhance text due to an unexpected error: {str(e)}"}, 500)
 
 # --- API Route: Save a Journal Entry to MongoDB and Local File ---
 @app.route('/save_entry', methods=['POST'])
@@ -136,65 +514,141 @@ def save_entry():
 
     if not title or not original_text:
         app.logger.warning("Save entry request missing title or original text.")
-        return jsonify({"error": "Title and original text are required"}), 400
+        return ojson({"error": "Title and original text are required"}, 400)
 
     try:
-        current_datetime = datetime.now()
-        entry_to_save = {
-            "title": title,
-            "originalText": original_text,
-            "enhancedText": enhanced_text,
-            "imageUrl": image_url, # Store base64 or URL directly for display
-            "timestamp": current_datetime.isoformat(), # ISO format for easy sorting and parsing
-            "date": current_datetime.strftime("%Y-%m-%d"),
-            "time": current_datetime.strftime("%H:%M:%S")
-        }
-
-        # Save to local file first
+        entry_to_save = build_entry(title, original_text, enhanced_text, image_url)
+
+        # Schedule the local file write; it completes in the background
         file_name = save_entry_to_local_file(entry_to_save)
         if file_name:
             entry_to_save["fileName"] = file_name # Add filename to MongoDB entry
-            app.logger.info(f"File name '{file_name}' added to MongoDB entry data for '{title}'.")
+            app.logger.info("File name '%s' added to MongoDB entry data for '%s'.", file_name, title)
         else:
             # Handle case where file saving failed but we still want to save to DB
-            app.logger.warning(f"Could not generate filename for entry '{title}'. Entry will be saved to DB without fileName.")
+            app.logger.warning("Could not generate filename for entry '%s'. Entry will be saved to DB without fileName.", title)
             entry_to_save["fileName"] = None # Explicitly set to None if saving failed
 
         # Save to MongoDB
         result = journal_collection.insert_one(entry_to_save)
-        app.logger.info(f"Entry saved to MongoDB with ID: {result.inserted_id}")
+        app.logger.info("Entry saved to MongoDB with ID: %s", result.inserted_id)
 
         message = "Memory saved successfully! ✨"
         if not file_name:
             message += " (Note: Local text file could not be saved. 😟)"
 
         # Return the saved entry's details (including _id and fileName)
-        # This is useful if the frontend needs to immediately display the new entry
-        saved_entry = journal_collection.find_one({"_id": result.inserted_id})
-        saved_entry['_id'] = str(saved_entry['_id']) # Convert ObjectId to string for JSON
-        return jsonify({"message": message, "entry": saved_entry}), 201
+        # This is useful if the frontend needs to immediately display the new entry.
+        # insert_one already set _id on entry_to_save, so there is no need to re-fetch it.
+        return ojson({"message": message, "entry": add_image_url(entry_to_save)}, 201)
 
     except Exception as e:
         app.logger.error(f"Error saving entry to MongoDB or local file: {e}", exc_info=True)
-        return jsonify({"error": f"Failed to save memory: {str(e)} 😔"}), 500
+        return ojson({"error": f"Failed to save memory: {str(e)} 😔"}, 500)
+
+# --- API Route: Save Many Journal Entries in One Round-Trip ---
+@app.route('/save_entries_bulk', methods=['POST'])
+def save_entries_bulk():
+    """
+    Saves a list of journal entries with a single unacknowledged insert_many.
+    The request returns as soon as the batch is handed to MongoDB, so write
+    errors are not reported back to the client.
+    """
+    data = request.json
+    if not isinstance(data, list) or not data:
+        app.logger.warning("Bulk save request did not contain a list of entries.")
+        return ojson({"error": "A non-empty list of entries is required"}, 400)
+
+    if any(not isinstance(item, dict) or not item.get('title') or not item.get('originalText') for item in data):
+        app.logger.warning("Bulk save request contained an entry missing title or original text.")
+        return ojson({"error": "Title and original text are required for every entry"}, 400)
+
+    try:
+        entries_to_save = []
+        for item in data:
+            entry = build_entry(item['title'], item['originalText'], item.get('enhancedText'), item.get('imageUrl'))
+            entry["fileName"] = save_entry_to_local_file(entry)
+            entries_to_save.append(entry)
+
+        # w=0: don't wait for the server to acknowledge, ordered=False: let the server insert in parallel
+        result = journal_collection.with_options(write_concern=WriteConcern(w=0)).insert_many(entries_to_save, ordered=False)
+        app.logger.info("Submitted %d entries to MongoDB in bulk.", len(entries_to_save))
 
-# --- API Route: Get All Journal Entries ---
+        return ojson({
+            "message": f"{len(entries_to_save)} memories are being saved! ✨",
+            "ids": result.inserted_ids
+        }, 202)
+
+    except Exception as e:
+        app.logger.error(f"Error bulk saving entries to MongoDB or local files: {e}", exc_info=True)
+        return ojson({"error": f"Failed to save memories: {str(e)} 😔"}, 500)
+
+# --- API Route: Get Journal Entries, One Page at a Time ---
 @app.route('/get_entries', methods=['GET'])
 def get_entries():
+    """
+    Streams journal entries as a JSON array, most recent first.
+    Paging is opt-in: without limit every entry is returned. Optional query
+    args: limit (page size, max 200) and before (an ISO timestamp; pass the
+    timestamp of the last entry received to get the next page).
+    """
+    try:
+        # limit(0) means no limit in MongoDB
+        limit = min(max(int(request.args['limit']), 1), ENTRIES_MAX_PAGE_SIZE) if 'limit' in request.args else 0
+    except ValueError:
+        app.logger.warning("Invalid limit for get_entries: %s", request.args.get('limit'))
+        return ojson({"error": "limit must be an integer"}, 400)
+    before = request.args.get('before')
+    query = {"timestamp": {"$lt": before}} if before else {}
+
     try:
         # Fetch entries, sort by timestamp in descending order (most recent first)
-        entries_cursor = journal_collection.find().sort("timestamp", -1)
+        entries_cursor = journal_collection.find(query).sort("timestamp", -1).limit(limit)
+        # Pull the first entry here so database errors still produce a proper 500 response
+        first_entry = next(entries_cursor, None)
+    except Exception as e:
+        app.logger.error(f"Error fetching entries from MongoDB: {e}", exc_info=True)
+        return ojson({"error": f"Failed to fetch memories: {str(e)} 💔"}, 500)
+
+    def generate():
+        # Serialize one entry at a time so the full page is never held in memory
+        yield b'['
+        count = 0
+        if first_entry is not None:
+            yield dump_json(add_image_url(first_entry))
+            count = 1
+            for entry in entries_cursor:
+                yield b',' + dump_json(add_image_url(entry))
+                count += 1
+        yield b']'
+        app.logger.info("Streamed %d entries from MongoDB.", count)
 
-        entries_list = []
-        for entry in entries_cursor:
-            entry['_id'] = str(entry['_id']) # Convert ObjectId to string for JSON serialization
-            entries_list.append(entry)
+    return app.response_class(stream_with_context(generate()), status=200, mimetype='application/json')
 
-        app.logger.info(f"Fetched {len(entries_list)} entries from MongoDB.")
-        return jsonify(entries_list), 200
+# --- API Route: Serve an Entry's Image from GridFS ---
+@app.route('/get_image/<image_id>', methods=['GET'])
+def get_image(image_id):
+    """Streams an image stored in GridFS by its ObjectId."""
+    try:
+        image_file = image_fs.get(ObjectId(image_id))
+    except (InvalidId, gridfs.NoFile):
+        app.logger.warning("Requested image not found: %s", image_id)
+        return ojson({"error": "Image not found"}, 404)
     except Exception as e:
-        app.logger.error(f"Error fetching entries from MongoDB: {e}", exc_info=True)
-        return jsonify({"error": f"Failed to fetch memories: {str(e)} 💔"}), 500
+        app.logger.error(f"Error fetching image '{image_id}' from GridFS: {e}", exc_info=True)
+        return ojson({"error": f"Could not retrieve image: {str(e)}"}, 500)
+
+    content_type = (image_file.metadata or {}).get("contentType")
+    if content_type not in ALLOWED_IMAGE_TYPES:
+        content_type = "application/octet-stream"
+    # Iterating a GridOut yields newline-delimited lines, so stream it chunk by chunk instead
+    response = app.response_class(iter(image_file.readchunk, b''), mimetype=content_type)
+    response.content_length = image_file.length
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    # Stored images never change, so browsers can keep them indefinitely
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    return response
 
 # --- NEW API Route: Serve Saved Text File ---
 @app.route('/get_memory_file/<filename>', methods=['GET'])
@@ -204,36 +658,59 @@ def get_memory_file(filename):
     Includes basic security checks for filename.
     """
     try:
-        # Prevent directory traversal attacks
-        safe_path = os.path.abspath(os.path.join(JOURNAL_FILES_DIR, filename))
-        if not safe_path.startswith(os.path.abspath(JOURNAL_FILES_DIR)):
-            app.logger.warning(f"Attempted directory traversal: {filename}")
-            return jsonify({"error": "Invalid filename"}), 400
-
-        # Check if the file exists before attempting to serve
-        if not os.path.exists(safe_path):
-            app.logger.warning(f"Requested file not found: {safe_path}")
-            return jsonify({"error": "File not found"}), 404
-
-        app.logger.info(f"Serving file: {filename} from {JOURNAL_FILES_DIR}")
-        # send_from_directory will handle file streaming and content-type automatically
+        # Prevent directory traversal attacks; saved filenames never contain path separators
+        if '/' in filename or '\\' in filename:
+            app.logger.warning("Attempted directory traversal: %s", filename)
+            return ojson({"error": "Invalid filename"}, 400)
+        safe_path = os.path.abspath(os.path.join(JOURNAL_FILES_PREFIX, filename))
+        if not safe_path.startswith(JOURNAL_FILES_PREFIX):
+            app.logger.warning("Attempted directory traversal: %s", filename)
+            return ojson({"error": "Invalid filename"}, 400)
+
+        app.logger.info("Serving file: %s from %s", filename, JOURNAL_FILES_DIR)
+        # send_from_directory will handle file streaming and content-type automatically,
+        # and raises NotFound if the file doesn't exist
         return send_from_directory(JOURNAL_FILES_DIR, filename, as_attachment=True) # as_attachment=True prompts download
+    except NotFound:
+        app.logger.warning("Requested file not found: %s", filename)
+        return ojson({"error": "File not found"}, 404)
     except Exception as e:
         app.logger.error(f"Error serving file '{filename}': {e}", exc_info=True)
-        return jsonify({"error": f"Could not retrieve file: {str(e)}"}), 500
+        return ojson({"error": f"Could not retrieve file: {str(e)}"}, 500)
+
+# --- Startup check: make sure Ollama and the model are available ---
+# Runs at import so every gunicorn worker checks (and warms) Ollama, not just `python app.py`
+app.logger.info("Attempting to check Ollama for model: %s...", model_name)
+try:
+    # This will raise an exception if the model doesn't exist or Ollama isn't running
+    retry_with_backoff(lambda: ollama_client.show(model_name), "Ollama model check")
+    app.logger.info("Ollama model '%s' found. ✅", model_name)
+    app.logger.info("Concurrent Ollama requests capped at JOURNAL_OLLAMA_SLOTS=%d per worker. "
+                    "Start 'ollama serve' with OLLAMA_NUM_PARALLEL set to this times the number of workers "
+                    "(and OLLAMA_MAX_LOADED_MODELS >= 2 to keep the chat and embedding models loaded together).",
+                    JOURNAL_OLLAMA_SLOTS)
+    warm_enhance_prompt()
+except Exception as e:
+    app.logger.error(f"Error: Ollama model '{model_name}' not found or Ollama is not running. "
+                     f"Please ensure Ollama is running and you have pulled the model using 'ollama pull {model_name}'. "
+                     f"Details: {e} ❌")
+    # Exit if Ollama is still unavailable after retrying, as the app relies on it
+    exit(1)
+
+# The semantic cache is optional: without the embedding model, run without it
+try:
+    ollama_client.show(embed_model_name)
+    app.logger.info("Embedding model '%s' found, enhancement cache enabled.", embed_model_name)
+except Exception as e:
+    enhance_cache_enabled = False
+    app.logger.warning(f"Embedding model '{embed_model_name}' not available, enhancement cache disabled. "
+                       f"Run 'ollama pull {embed_model_name}' to enable it. Details: {e}")
 
 # --- Main execution block ---
+# For production, serve the app with gunicorn so requests run in parallel:
+#   gunicorn -w 4 -k gthread --threads 8 --timeout 180 -b 0.0.0.0:5000 app:app
+# --timeout must cover worker startup: up to ~30s of MongoDB retries, ~20s of Ollama
+# retries and the prompt warm-up (bounded by the 120s Ollama client timeout).
 if __name__ == '__main__':
-    app.logger.info(f"Attempting to check Ollama for model: {model_name}...")
-    try:
-        # This will raise an exception if the model doesn't exist or Ollama isn't running
-        ollama.show(model_name)
-        app.logger.info(f"Ollama model '{model_name}' found. Starting Flask server... ✅")
-    except Exception as e:
-        app.logger.error(f"Error: Ollama model '{model_name}' not found or Ollama is not running. "
-                         f"Please ensure Ollama is running and you have pulled the model using 'ollama pull {model_name}'. "
-                         f"Details: {e} ❌")
-        # Exit if Ollama setup is not correct, as the app relies on it
-        exit(1)
-
-    app.run(debug=True, port=5000) # Run in debug mode for development
\ No newline at end of file
+    app.logger.info("Starting Flask development server... (set FLASK_DEBUG=1 for the debugger and reloader)")
+    app.run(port=5000, threaded=True)